@@ -5,21 +5,58 @@ from torchvision.transforms.functional import InterpolationMode
 from transformers import AutoModel, AutoTokenizer, AutoConfig
 import os
 import time
+import gc
+import multiprocessing
+from food_result import merge_meal_result
+from cpu_backend import (
+    configure_cpu_threads,
+    export_vision_encoder,
+    quantize_for_cpu,
+    use_external_vision_encoder,
+)
 
 
 class InternVL3_model:
-    def __init__(self, model_path="OpenGVLab/InternVL3-2B"):
+    def __init__(
+        self,
+        model_path="OpenGVLab/InternVL3-2B",
+        device=None,
+        num_threads=None,
+        num_interop_threads=None,
+        quantize=True,
+        vision_backend=None,
+        export_vision=True,
+    ):
+        """
+        device: 为None时自动选择 mps/cuda/cpu，可传 "cpu" 强制使用CPU后端
+        以下参数只对CPU后端生效：
+        num_threads / num_interop_threads: intra-op / inter-op 线程数
+        quantize: 是否对 Linear 层做动态int8量化
+        vision_backend: None、"onnxruntime" 或 "openvino"，视觉编码器导出为ONNX后用其运行
+        export_vision: ONNX文件不存在时是否由本进程导出；多worker时由父进程
+            通过 prepare_vision_onnx 提前导出，worker中设为False
+        """
         self.model_path = model_path
-        if torch.backends.mps.is_available():
+        if device is not None:
+            self.device = device
+        elif torch.backends.mps.is_available():
             self.device = "mps"
-            os.environ["PYTORCH_MPS_HIGH_WATERMARK_RATIO"] = "0.0"
         elif torch.cuda.is_available():
             self.device = "cuda"
         else:
             self.device = "cpu"
+        if self.device == "mps":
+            os.environ["PYTORCH_MPS_HIGH_WATERMARK_RATIO"] = "0.0"
         print(f"Using device: {self.device}")
 
         self.device_map = "auto"
+        # CPU后端使用float32（动态量化需要），其余设备使用bfloat16
+        self.dtype = torch.float32 if self.device == "cpu" else torch.bfloat16
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+        self.quantize = quantize
+        self.vision_backend = vision_backend
+        self.export_vision = export_vision
 
         self.model, self.tokenizer = None, None
         self.load_model()
@@ -36,6 +73,10 @@ class InternVL3_model:
         return model
 
     def load_model(self):
+        if self.device == "cpu":
+            self.load_cpu_model()
+            return
+
         try:
             model = AutoModel.from_pretrained(
                 self.model_path,
@@ -78,6 +119,92 @@ class InternVL3_model:
             self.model = self.mps_optimize(model).to(self.device)
             self.tokenizer = tokenizer
 
+    def load_cpu_model(self):
+        """
+        CPU后端：不走 bitsandbytes 的8bit路径，直接加载float32模型，
+        可选导出视觉编码器到 ONNX Runtime/OpenVINO，再对 Linear 层做动态int8量化
+        """
+        configure_cpu_threads(self.num_threads, self.num_interop_threads)
+        try:
+            model = AutoModel.from_pretrained(
+                self.model_path,
+                torch_dtype=torch.float32,
+                low_cpu_mem_usage=True,
+                use_flash_attn=False,
+                trust_remote_code=True,
+            ).eval()
+
+            tokenizer = AutoTokenizer.from_pretrained(
+                self.model_path, trust_remote_code=True, use_fast=False
+            )
+        except Exception as e:
+            print(f"模型加载完全失败: {e}")
+            return
+
+        if self.vision_backend is not None:
+            try:
+                onnx_path = vision_onnx_path(self.model_path)
+                if not os.path.exists(onnx_path):
+                    if not self.export_vision:
+                        raise FileNotFoundError(onnx_path)
+                    export_vision_encoder(model, onnx_path)
+                use_external_vision_encoder(
+                    model,
+                    onnx_path,
+                    backend=self.vision_backend,
+                    num_threads=self.num_threads,
+                )
+                # 视觉编码器已由外部运行，释放PyTorch中的ViT和mlp1，也不再对其量化
+                model.vision_model = None
+                model.mlp1 = None
+                gc.collect()
+            except Exception as e:
+                print(f"视觉编码器导出/加载失败，继续使用PyTorch: {e}")
+
+        if self.quantize:
+            model = quantize_for_cpu(model)
+
+        self.model = model
+        self.tokenizer = tokenizer
+        print("模型加载成功（CPU）！")
+
+
+def vision_onnx_path(model_path):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    onnx_dir = os.path.join(script_dir, "onnx")
+    os.makedirs(onnx_dir, exist_ok=True)
+    model_name = model_path.rstrip("/").replace("/", "_")
+    return os.path.join(onnx_dir, f"{model_name}_vision.onnx")
+
+
+def _export_vision_onnx(model_path, onnx_path):
+    model = AutoModel.from_pretrained(
+        model_path,
+        torch_dtype=torch.float32,
+        low_cpu_mem_usage=True,
+        use_flash_attn=False,
+        trust_remote_code=True,
+    ).eval()
+    export_vision_encoder(model, onnx_path)
+
+
+def prepare_vision_onnx(model_path):
+    """
+    在启动多个CPU worker之前导出视觉编码器，避免多个worker同时写同一个文件
+    导出需要加载完整的fp32模型，在临时子进程中进行，退出后内存即释放
+    """
+    onnx_path = vision_onnx_path(model_path)
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    ctx = multiprocessing.get_context("spawn")
+    process = ctx.Process(target=_export_vision_onnx, args=(model_path, onnx_path))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        print(f"视觉编码器导出失败（exitcode={process.exitcode}），worker将使用PyTorch")
+    return onnx_path
+
 
 IMAGENET_MEAN = (0.485, 0.456, 0.406)
 IMAGENET_STD = (0.229, 0.224, 0.225)
@@ -158,15 +285,16 @@ def dynamic_preprocess(
     return processed_images
 
 
-def load_image(image_file, input_size=448, max_num=4):
+def load_image(image_file, input_size=448, max_num=4, use_thumbnail=True):
     """
     加载和预处理图像
     max_num: 最大块数，用于控制内存使用
+    use_thumbnail: 块数大于1时是否额外加入一张缩略图
     """
     image = Image.open(image_file).convert("RGB")
     transform = build_transform(input_size=input_size)
     images = dynamic_preprocess(
-        image, image_size=input_size, use_thumbnail=True, max_num=max_num
+        image, image_size=input_size, use_thumbnail=use_thumbnail, max_num=max_num
     )
     pixel_values = [transform(image) for image in images]
     pixel_values = torch.stack(pixel_values)
@@ -182,21 +310,76 @@ def get_food_prompt():
             return prompt.replace("\n", " ").strip()
 
 
-def analyze_food_image(image_path, model, tokenizer, max_tiles=4, device="cpu"):
+def split_tile_budget(num_images, max_tiles):
+    """
+    将一餐的总块数预算分配给每张图片，返回 (每张图片的max_num, 是否使用缩略图)
+    多图时缩略图也计入每张图片的份额；每张图片至少1块，
+    因此图片数超过 max_tiles 时总块数为图片数
+    """
+    if num_images == 1:
+        return max_tiles, True
+
+    share = max(1, max_tiles // num_images)
+    if share >= 3:
+        # 留出1块给缩略图
+        return share - 1, True
+    return share, False
+
+
+def build_meal_question(num_images):
+    """
+    构建问题，多图时为每张图片编号并提示合并同一道菜
+    """
+    if num_images == 1:
+        return "<image>\n" + get_food_prompt()
+
+    image_tags = "".join(f"Image-{i + 1}: <image>\n" for i in range(num_images))
+    meal_note = (
+        f"These {num_images} images are photos of the same meal. "
+        "List each dish only once even if it appears in several images. "
+    )
+    return image_tags + meal_note + get_food_prompt()
+
+
+# analyze_food_image 失败时返回的字符串前缀
+ANALYSIS_ERROR_PREFIXES = ("错误：", "分析过程中出现错误")
+
+
+def is_analysis_error(result):
+    return isinstance(result, str) and result.startswith(ANALYSIS_ERROR_PREFIXES)
+
+
+def analyze_food_image(
+    image_path, model, tokenizer, max_tiles=4, device="cpu", dtype=torch.bfloat16
+):
     """
     分析食物图片的主函数
+    image_path: 单张图片路径，或同一餐多张图片路径的列表
+    多图时所有图片在一次 chat 调用中完成（一次prefill、一次decode），
+    max_tiles 为所有图片共享的总块数预算（每张图片至少1块），结果中的 foods 会去重
+    dtype: 输入张量的精度，需与模型一致（CPU后端为float32）
     """
+    image_paths = [image_path] if isinstance(image_path, str) else list(image_path)
+    if not image_paths:
+        return "错误：没有提供图片"
+
     # 检查文件是否存在
-    if not os.path.exists(image_path):
-        return f"错误：图片文件不存在 - {image_path}"
+    for path in image_paths:
+        if not os.path.exists(path):
+            return f"错误：图片文件不存在 - {path}"
 
     try:
         # 加载图像，限制最大块数以节省内存
-        print(f"正在加载图像: {image_path}")
-        pixel_values = (
-            load_image(image_path, max_num=max_tiles).to(torch.bfloat16).to(device)
-        )
-        print(f"图像已处理为 {pixel_values.shape[0]} 个块")
+        max_num, use_thumbnail = split_tile_budget(len(image_paths), max_tiles)
+        pixel_values_list = []
+        for path in image_paths:
+            print(f"正在加载图像: {path}")
+            pixel_values_list.append(
+                load_image(path, max_num=max_num, use_thumbnail=use_thumbnail)
+            )
+        num_patches_list = [pv.size(0) for pv in pixel_values_list]
+        pixel_values = torch.cat(pixel_values_list).to(dtype).to(device)
+        print(f"图像已处理为 {pixel_values.shape[0]} 个块 {num_patches_list}")
 
         # 生成配置
         generation_config = dict(
@@ -206,13 +389,21 @@ def analyze_food_image(image_path, model, tokenizer, max_tiles=4, device="cpu"):
         )
 
         # 构建问题
-        question = "<image>\n" + get_food_prompt()
+        question = build_meal_question(len(image_paths))
 
         # 进行推理
         print("正在分析图像...")
-        response = model.chat(tokenizer, pixel_values, question, generation_config)
-
-        return response
+        if len(image_paths) == 1:
+            return model.chat(tokenizer, pixel_values, question, generation_config)
+
+        response = model.chat(
+            tokenizer,
+            pixel_values,
+            question,
+            generation_config,
+            num_patches_list=num_patches_list,
+        )
+        return merge_meal_result(response)
 
     except Exception as e:
         return f"分析过程中出现错误: {str(e)}"
@@ -233,7 +424,12 @@ def main():
 
     print(f"\n开始分析图像，最大块数限制: {max_tiles}")
     result = analyze_food_image(
-        image_path, model, tokenizer, max_tiles=max_tiles, device=model.device
+        image_path,
+        model,
+        tokenizer,
+        max_tiles=max_tiles,
+        device=model.device,
+        dtype=intern_model.dtype,
     )
     end_time = time.time()
     print(f"分析完成，耗时: {end_time - start_time:.2f} 秒")
@@ -0,0 +1,190 @@
+import os
+
+import torch
+
+
+def configure_cpu_threads(num_threads=None, num_interop_threads=None):
+    """
+    设置CPU推理的线程数
+    num_threads: 算子内并行线程数（intra-op），默认使用当前进程可用的全部核心
+    num_interop_threads: 算子间并行线程数（inter-op），默认1
+    """
+    if num_threads is None:
+        num_threads = len(available_cores())
+    if num_interop_threads is None:
+        num_interop_threads = 1
+
+    torch.set_num_threads(num_threads)
+    try:
+        # 只能在进程中第一次并行计算之前设置
+        torch.set_num_interop_threads(num_interop_threads)
+    except RuntimeError as e:
+        print(f"inter-op 线程数设置失败: {e}")
+    print(f"CPU线程: intra-op={num_threads}, inter-op={num_interop_threads}")
+
+
+def available_cores():
+    """当前进程可用的CPU核心列表"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_core_units(cores):
+    """
+    按物理核心对逻辑CPU分组，同一物理核心的超线程放在同一组
+    无法读取CPU拓扑时（非Linux等）每个逻辑CPU单独一组
+    """
+    available = set(cores)
+    units = []
+    seen = set()
+    for cpu in cores:
+        if cpu in seen:
+            continue
+        path = f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"
+        try:
+            with open(path) as f:
+                siblings = parse_cpu_list(f.read())
+        except (OSError, ValueError):
+            return [[c] for c in cores]
+        unit = sorted(available & (siblings | {cpu}))
+        seen.update(unit)
+        units.append(unit)
+    return units
+
+
+def parse_cpu_list(text):
+    """解析 "0,8" 或 "0-1" 格式的CPU列表"""
+    cpus = set()
+    for part in text.strip().split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.update(range(int(start), int(end) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def split_core_groups(num_groups, cores=None):
+    """
+    将CPU核心划分为 num_groups 个核心组，每个worker进程绑定一组
+    以物理核心为单位划分，避免两个worker共享同一物理核心的超线程
+    """
+    cores = available_cores() if cores is None else list(cores)
+    units = physical_core_units(cores)
+    num_groups = max(1, min(num_groups, len(units)))
+    group_size = len(units) // num_groups
+    groups = [units[i * group_size : (i + 1) * group_size] for i in range(num_groups)]
+    # 余下的物理核心分给最后一组
+    groups[-1].extend(units[num_groups * group_size :])
+    return [[cpu for unit in group for cpu in unit] for group in groups]
+
+
+def pin_to_cores(cores):
+    """将当前进程绑定到指定核心（仅Linux支持）"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+        print(f"进程 {os.getpid()} 已绑定核心: {cores}")
+    else:
+        print("当前系统不支持绑定CPU核心，跳过")
+
+
+def quantize_for_cpu(model):
+    """
+    对模型中的 Linear 层做动态int8量化
+    不依赖 bitsandbytes/CUDA，模型需为 float32
+    """
+    model = torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    print("模型已完成动态int8量化")
+    return model
+
+
+class _VisionEncoder(torch.nn.Module):
+    """InternVL 的 extract_feature（ViT + pixel shuffle + mlp1），用于导出ONNX"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.extract_feature(pixel_values)
+
+
+def export_vision_encoder(model, onnx_path, input_size=448):
+    """
+    将 InternVL 的视觉编码器导出为ONNX，需在量化之前调用
+    先写入临时文件再替换，导出失败时不会留下不完整的文件
+    """
+    tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+    dummy = torch.randn(1, 3, input_size, input_size, dtype=torch.float32)
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                _VisionEncoder(model),
+                (dummy,),
+                tmp_path,
+                input_names=["pixel_values"],
+                output_names=["vit_embeds"],
+                dynamic_axes={
+                    "pixel_values": {0: "tiles"},
+                    "vit_embeds": {0: "tiles"},
+                },
+                opset_version=17,
+            )
+        os.replace(tmp_path, onnx_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    print(f"视觉编码器已导出: {onnx_path}")
+
+
+def load_vision_session(onnx_path, backend="onnxruntime", num_threads=None):
+    """
+    加载导出的视觉编码器，返回 pixel_values(numpy) -> vit_embeds(numpy) 的函数
+    backend: "onnxruntime" 或 "openvino"
+    """
+    if backend == "onnxruntime":
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        return lambda pixel_values: session.run(
+            None, {"pixel_values": pixel_values}
+        )[0]
+
+    if backend == "openvino":
+        import openvino as ov
+
+        config = {}
+        if num_threads is not None:
+            config["INFERENCE_NUM_THREADS"] = num_threads
+        compiled = ov.Core().compile_model(onnx_path, "CPU", config)
+        return lambda pixel_values: compiled(pixel_values)[0]
+
+    raise ValueError(f"不支持的视觉编码器后端: {backend}")
+
+
+def use_external_vision_encoder(
+    model, onnx_path, backend="onnxruntime", num_threads=None
+):
+    """
+    用 ONNX Runtime / OpenVINO 运行的视觉编码器替换 model.extract_feature
+    语言模型部分仍由 PyTorch 执行
+    """
+    run = load_vision_session(onnx_path, backend=backend, num_threads=num_threads)
+
+    def extract_feature(pixel_values):
+        vit_embeds = run(pixel_values.float().numpy())
+        return torch.from_numpy(vit_embeds).to(pixel_values.dtype)
+
+    model.extract_feature = extract_feature
+    print(f"视觉编码器使用 {backend} 运行")
+    return model
@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from cpu_backend import pin_to_cores, split_core_groups
+from InternVL3 import InternVL3_model, analyze_food_image, prepare_vision_onnx
+
+# 每个worker进程中的模型实例
+_worker_model = None
+# 所有worker加载完模型后才放行预热任务
+_ready_barrier = None
+
+
+def _init_worker(core_groups, ready_barrier, model_cls, model_path, model_kwargs):
+    """worker进程启动时：领取一个核心组并绑定，然后加载CPU模型"""
+    global _worker_model, _ready_barrier
+    _ready_barrier = ready_barrier
+    cores = core_groups.get()
+    pin_to_cores(cores)
+    _worker_model = model_cls(
+        model_path=model_path, device="cpu", num_threads=len(cores), **model_kwargs
+    )
+
+
+def _warmup():
+    # 每个worker各领取一个预热任务，阻塞到所有worker都加载完成
+    _ready_barrier.wait()
+
+
+def _analyze(image_paths, max_tiles):
+    return analyze_food_image(
+        image_paths,
+        _worker_model.model,
+        _worker_model.tokenizer,
+        max_tiles=max_tiles,
+        device="cpu",
+        dtype=_worker_model.dtype,
+    )
+
+
+class CPUWorkerPool:
+    """
+    CPU节点上的多进程推理：每个worker进程绑定一个核心组并各自加载一份模型，
+    请求由进程池分发，避免单个进程的线程在全部核心上互相争抢
+    model_cls 可替换为 fake_model.FakeInternVL3_model 用于压测
+    """
+
+    def __init__(
+        self,
+        num_workers,
+        model_path="OpenGVLab/InternVL3-2B",
+        model_cls=InternVL3_model,
+        **model_kwargs,
+    ):
+        ctx = multiprocessing.get_context("spawn")
+        if model_kwargs.get("vision_backend") is not None:
+            # 由父进程统一导出一次视觉编码器，worker只负责加载
+            prepare_vision_onnx(model_path)
+            model_kwargs["export_vision"] = False
+
+        core_groups = split_core_groups(num_workers)
+        queue = ctx.Queue()
+        for cores in core_groups:
+            queue.put(cores)
+
+        self.num_workers = len(core_groups)
+        ready_barrier = ctx.Barrier(self.num_workers)
+        print(f"启动 {self.num_workers} 个CPU worker，核心组: {core_groups}")
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(queue, ready_barrier, model_cls, model_path, model_kwargs),
+        )
+
+        # 进程池按需启动worker，这里提交与worker数相同的预热任务，
+        # 让所有worker在服务开始前启动并加载好模型
+        warmups = [self.executor.submit(_warmup) for _ in range(self.num_workers)]
+        for future in warmups:
+            future.result()
+        print("所有CPU worker已就绪")
+
+    async def analyze(self, image_paths, max_tiles=4):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, _analyze, image_paths, max_tiles
+        )
+
+    def shutdown(self):
+        self.executor.shutdown()
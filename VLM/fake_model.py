@@ -0,0 +1,109 @@
+import json
+import random
+import time
+
+import torch
+
+# 伪模型固定返回的结果，格式与 prompts/food_prompt.txt 一致
+FAKE_RESPONSE = {
+    "foods": [
+        {
+            "en_name": "Rice, white, cooked",
+            "estimated_weight_grams": 150,
+            "confidence": 0.9,
+            "method": "steamed",
+        },
+        {
+            "en_name": "Broccoli, cooked",
+            "estimated_weight_grams": 80,
+            "confidence": 0.8,
+            "method": "boiled",
+        },
+    ]
+}
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布，返回一个无参函数，每次调用得到一个延迟（秒）
+    constant:2          固定2秒
+    uniform:1,3         1~3秒均匀分布
+    normal:2,0.5        均值2秒、标准差0.5秒（截断到0以上）
+    lognormal:0.7,0.3   ln(延迟) 服从 N(0.7, 0.3)
+    exponential:2       均值2秒的指数分布
+    """
+    name, _, args = spec.partition(":")
+    try:
+        params = [float(x) for x in args.split(",") if x]
+    except ValueError:
+        raise ValueError(f"延迟分布参数不是数字: {spec}")
+
+    num_params = {
+        "constant": 1,
+        "uniform": 2,
+        "normal": 2,
+        "lognormal": 2,
+        "exponential": 1,
+    }
+    if name not in num_params:
+        raise ValueError(f"不支持的延迟分布: {spec}")
+    if len(params) != num_params[name]:
+        raise ValueError(f"{name} 需要 {num_params[name]} 个参数: {spec}")
+
+    if name == "constant":
+        if params[0] < 0:
+            raise ValueError(f"延迟不能为负数: {spec}")
+        return lambda: params[0]
+    if name == "uniform":
+        if not 0 <= params[0] <= params[1]:
+            raise ValueError(f"uniform 需要 0 <= 下限 <= 上限: {spec}")
+        return lambda: random.uniform(params[0], params[1])
+    if params[-1] < 0 and name in ("normal", "lognormal"):
+        raise ValueError(f"标准差不能为负数: {spec}")
+    if name == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if name == "lognormal":
+        return lambda: random.lognormvariate(params[0], params[1])
+    if params[0] <= 0:
+        raise ValueError(f"exponential 的均值必须大于0: {spec}")
+    return lambda: random.expovariate(1 / params[0])
+
+
+class FakeChatModel:
+    """
+    模拟 InternVL 的 chat 接口：按延迟分布阻塞后返回固定结果，不需要下载权重
+    与真实模型一样在调用线程中阻塞，便于压测排队行为
+    error_rate: 推理失败的概率，用于压测错误处理
+    """
+
+    def __init__(self, latency="constant:2", error_rate=0.0):
+        if not 0 <= error_rate <= 1:
+            raise ValueError(f"error_rate 必须在0~1之间: {error_rate}")
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.device = "cpu"
+
+    def chat(self, tokenizer, pixel_values, question, generation_config, **kwargs):
+        time.sleep(self.sample_latency())
+        if random.random() < self.error_rate:
+            raise RuntimeError("fake model inference failed")
+        return json.dumps(FAKE_RESPONSE, ensure_ascii=False, indent=2)
+
+
+class FakeInternVL3_model:
+    """与 InternVL3_model 相同属性的伪模型，用于无GPU/无权重环境下压测服务"""
+
+    def __init__(
+        self,
+        model_path=None,
+        device="cpu",
+        latency="constant:2",
+        error_rate=0.0,
+        **kwargs,
+    ):
+        self.model_path = model_path
+        self.device = device
+        self.dtype = torch.float32
+        self.model = FakeChatModel(latency, error_rate)
+        self.tokenizer = None
+        print(f"Using fake model, latency: {latency}, error rate: {error_rate}")
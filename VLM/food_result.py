@@ -0,0 +1,56 @@
+import json
+
+
+def extract_json(response):
+    """
+    从模型输出中提取JSON部分，失败时返回None
+    """
+    json_start = response.find("{")
+    json_end = response.rfind("}") + 1
+    if json_start == -1 or json_end == 0:
+        return None
+    try:
+        return json.loads(response[json_start:json_end])
+    except json.JSONDecodeError:
+        return None
+
+
+def dedupe_foods(foods):
+    """
+    合并同一餐多张图片中重复出现的食物
+    按 en_name 归一化后去重，保留置信度最高的一条，避免重复计算卡路里
+    """
+    merged = {}
+    for food in foods:
+        if not isinstance(food, dict):
+            continue
+        name = str(food.get("en_name", "")).strip().lower()
+        if not name:
+            continue
+        current = merged.get(name)
+        if current is None or _confidence(food) > _confidence(current):
+            merged[name] = food
+    return list(merged.values())
+
+
+def _confidence(food):
+    try:
+        return float(food.get("confidence", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def merge_meal_result(result):
+    """
+    对一餐的识别结果中的 foods 列表去重
+    result 可以是模型原始输出（str）或已解析的dict，返回类型与输入一致
+    无法解析时原样返回
+    """
+    parsed = extract_json(result) if isinstance(result, str) else result
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("foods"), list):
+        return result
+
+    parsed = dict(parsed, foods=dedupe_foods(parsed["foods"]))
+    if isinstance(result, str):
+        return json.dumps(parsed, ensure_ascii=False, indent=2)
+    return parsed
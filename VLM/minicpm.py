@@ -7,6 +7,8 @@ import gc
 from unittest.mock import patch
 import os
 from prompt import create_prompt
+from food_result import merge_meal_result
+from cpu_backend import configure_cpu_threads, quantize_for_cpu
 from typing import List, Dict, Any, Optional, Union, Tuple
 from time import time
 
@@ -42,12 +44,24 @@ def patch_resampler_module():
 
 
 class FoodRecognitionVLM:
-    def __init__(self, model_name="openbmb/MiniCPM-V-2_6", use_cpu_offload=True):
+    def __init__(
+        self,
+        model_name="openbmb/MiniCPM-V-2_6",
+        use_cpu_offload=True,
+        device=None,
+        num_threads=None,
+        num_interop_threads=None,
+        quantize=True,
+    ):
         """
         初始化MiniCPM-V-2.6模型用于食物识别
         针对Mac优化，不使用bitsandbytes
+        device 为 "cpu"（或无GPU）时使用CPU后端：float32 + 动态int8量化，
+        num_threads / num_interop_threads 设置 intra-op / inter-op 线程数
         """
-        if torch.cuda.is_available():
+        if device is not None:
+            self.device = device
+        elif torch.cuda.is_available():
             self.device = "cuda"
         elif torch.backends.mps.is_available():
             # 使用MPS设备（Mac专用）
@@ -60,6 +74,14 @@ class FoodRecognitionVLM:
         # 设置环境变量优化内存
         if self.device == "mps":
             os.environ["PYTORCH_MPS_HIGH_WATERMARK_RATIO"] = "0.0"
+        if self.device == "cpu":
+            configure_cpu_threads(num_threads, num_interop_threads)
+            with patch(
+                "transformers.dynamic_module_utils.get_imports", fixed_get_imports
+            ):
+                self.load_cpu_model(model_name, quantize)
+            return
+
         with patch("transformers.dynamic_module_utils.get_imports", fixed_get_imports):
             try:
                 print("Loading model with Mac-optimized settings...")
@@ -124,27 +146,57 @@ class FoodRecognitionVLM:
                     print(f"All loading methods failed: {e2}")
                     raise e2
 
-    def recognize_food(self, image_path, custom_format=None):
+    def load_cpu_model(self, model_name, quantize=True):
+        """
+        CPU后端：float32加载（不使用device_map卸载），可选动态int8量化
+        """
+        self.model = AutoModel.from_pretrained(
+            model_name,
+            trust_remote_code=True,
+            torch_dtype=torch.float32,
+            low_cpu_mem_usage=True,
+        )
+        self.model.eval()
+        if quantize:
+            self.model = quantize_for_cpu(self.model)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            model_name, trust_remote_code=True
+        )
+        print("Model loaded on CPU!")
+
+    def recognize_food(self, image_path, custom_format=None, max_slices=9):
         """
         识别图片中的食物并估算份量
 
         Args:
-            image_path (str): 图片路径
+            image_path (str | list): 图片路径，或同一餐多张图片路径的列表
             custom_format (dict): 自定义输出格式
+            max_slices (int): 多图时所有图片共享的总切片预算（含每张图片的原图缩略，
+                每张图片至少1块）
 
         Returns:
-            dict: 结构化的食物识别结果
+            dict: 结构化的食物识别结果，多图时 foods 已去重
         """
         gc.collect()
         if torch.backends.mps.is_available():
             torch.mps.empty_cache()
 
-        # 加载图片时限制尺寸
+        image_paths = [image_path] if isinstance(image_path, str) else list(image_path)
+        if not image_paths:
+            return {"error": "No image provided"}
 
-        image = Image.open(image_path).convert("RGB")
+        # 加载图片时限制尺寸
+        # 多图时不缩小：MiniCPM只切分大于448x448的图片，由 max_slice_nums 控制总预算
+        images = []
         max_size = (448, 448)
-        if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        for path in image_paths:
+            image = Image.open(path).convert("RGB")
+            if len(image_paths) == 1 and (
+                image.size[0] > max_size[0] or image.size[1] > max_size[1]
+            ):
+                image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            images.append(image)
 
         # 修改提示词，确保是中文
         if custom_format is None:
@@ -152,21 +204,32 @@ class FoodRecognitionVLM:
         else:
             format_instruction = f"请识别图片中的食物并按照以下格式输出：\n{json.dumps(custom_format, ensure_ascii=False, indent=2)}"
 
-        # 修改消息格式 - 这是关键修改
-        msgs = [
-            {"role": "user", "content": format_instruction}  # 只传递文本，图像单独传递
-        ]
+        if len(images) == 1:
+            # 修改消息格式 - 这是关键修改
+            msgs = [
+                {"role": "user", "content": format_instruction}  # 只传递文本，图像单独传递
+            ]
+            chat_kwargs = {"image": images[0]}
+        else:
+            # 多图：所有图片放在同一条消息中，一次调用完成整餐分析
+            meal_note = f"以下{len(images)}张图片是同一餐的照片，同一道菜即使出现在多张图片中也只列出一次。\n"
+            msgs = [{"role": "user", "content": images + [meal_note + format_instruction]}]
+            chat_kwargs = {
+                "image": None,
+                # 每张图片的份额包含1张原图缩略，其余为切片
+                "max_slice_nums": max(1, max_slices // len(images) - 1),
+            }
 
         try:
             with torch.no_grad():
                 # 修改调用方式
                 response = self.model.chat(
-                    image=image,  # 图像单独传递
                     msgs=msgs,  # 文本消息
                     tokenizer=self.tokenizer,
                     sampling=False,
                     temperature=0.1,
                     max_new_tokens=1024,
+                    **chat_kwargs,
                 )
 
             print(f"Raw response: {response}")  # 调试输出
@@ -179,6 +242,8 @@ class FoodRecognitionVLM:
                 if json_start != -1 and json_end != 0:
                     json_str = response[json_start:json_end]
                     result = json.loads(json_str)
+                    if len(images) > 1:
+                        result = merge_meal_result(result)
                     return result
                 else:
                     return {"raw_response": response, "error": "No valid JSON found"}
@@ -1,21 +1,97 @@
-from fastapi import FastAPI, UploadFile
-from InternVL3 import InternVL3_model, analyze_food_image
+import os
+import tempfile
+from typing import List
+
+from fastapi import FastAPI, HTTPException, UploadFile
+from InternVL3 import InternVL3_model, analyze_food_image, is_analysis_error
+from fake_model import FakeInternVL3_model, parse_latency
 import torch
 
+MODEL_PATH = "OpenGVLab/InternVL3-2B"
+MAX_TILES = 4
+# CPU节点：CPU_WORKERS>0 时启动多个绑定核心组的模型worker进程
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", "0"))
+# CPU后端视觉编码器：onnxruntime / openvino，不设置则使用PyTorch
+VISION_BACKEND = os.environ.get("VISION_BACKEND") or None
+# 压测用伪模型：设置为延迟分布时不加载真实权重，如 lognormal:0.7,0.3
+FAKE_MODEL = os.environ.get("FAKE_MODEL") or None
+# 伪模型推理失败的概率
+FAKE_ERROR_RATE = float(os.environ.get("FAKE_ERROR_RATE", "0"))
+
 app = FastAPI()
 
-# 模型只加载一次！
-intern_model = InternVL3_model(model_path="OpenGVLab/InternVL3-2B")
-model, tokenizer = intern_model.model, intern_model.tokenizer
-device = intern_model.device
+if FAKE_MODEL is not None:
+    # 启动时校验延迟分布，格式错误直接报错，而不是在worker中或请求时才失败
+    parse_latency(FAKE_MODEL)
+    model_cls = FakeInternVL3_model
+    model_kwargs = {"latency": FAKE_MODEL, "error_rate": FAKE_ERROR_RATE}
+else:
+    model_cls = InternVL3_model
+    model_kwargs = {"vision_backend": VISION_BACKEND}
+
+if CPU_WORKERS > 0:
+    from cpu_workers import CPUWorkerPool
+
+    worker_pool = CPUWorkerPool(
+        CPU_WORKERS, model_path=MODEL_PATH, model_cls=model_cls, **model_kwargs
+    )
+else:
+    # 模型只加载一次！
+    worker_pool = None
+    intern_model = model_cls(model_path=MODEL_PATH, **model_kwargs)
+    model, tokenizer = intern_model.model, intern_model.tokenizer
+    device = intern_model.device
+    dtype = intern_model.dtype
+
+
+async def save_uploads(files):
+    # 每个请求使用独立的临时文件，避免并发请求互相覆盖
+    image_paths = []
+    for file in files:
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+            f.write(await file.read())
+        image_paths.append(f.name)
+    return image_paths
+
+
+async def run_analysis(files):
+    image_paths = await save_uploads(files)
+    try:
+        if worker_pool is not None:
+            result = await worker_pool.analyze(image_paths, max_tiles=MAX_TILES)
+        else:
+            result = analyze_food_image(
+                image_paths,
+                model,
+                tokenizer,
+                max_tiles=MAX_TILES,
+                device=device,
+                dtype=dtype,
+            )
+    finally:
+        for path in image_paths:
+            os.remove(path)
+
+    # 分析失败时返回500，而不是把错误信息放在200响应里
+    if is_analysis_error(result):
+        raise HTTPException(status_code=500, detail=result)
+    return result
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if worker_pool is not None:
+        worker_pool.shutdown()
 
 
 @app.post("/analyze")
 async def analyze(file: UploadFile):
-    with open("temp.jpg", "wb") as f:
-        f.write(await file.read())
+    result = await run_analysis([file])
+    return {"result": result}
 
-    result = analyze_food_image(
-        "temp.jpg", model, tokenizer, max_tiles=4, device=device
-    )
+
+@app.post("/analyze_meal")
+async def analyze_meal(files: List[UploadFile]):
+    # 同一餐的多张图片，一次模型调用完成分析
+    result = await run_analysis(files)
     return {"result": result}
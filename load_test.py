@@ -0,0 +1,179 @@
+import argparse
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_images(image_dir):
+    """读取目录下所有图片到内存，避免压测时磁盘IO影响结果"""
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(image_dir, name), "rb") as f:
+                images.append((name, f.read()))
+    if not images:
+        raise SystemExit(f"目录中没有图片: {image_dir}")
+    return images
+
+
+def send_request(url, image, timeout, start=None):
+    """
+    发送一次请求，返回 (状态, 首字节时间, 总耗时)
+    状态为HTTP状态码，或请求异常的类型名
+    start: 计时起点（perf_counter），固定到达率模式下为计划发送时间，
+    这样在客户端排队等待的时间也计入延迟
+    """
+    name, data = image
+    if start is None:
+        start = time.perf_counter()
+    try:
+        with requests.post(
+            url, files={"file": (name, data)}, stream=True, timeout=timeout
+        ) as response:
+            ttfb = time.perf_counter() - start
+            for _ in response.iter_content(chunk_size=8192):
+                pass
+            return response.status_code, ttfb, time.perf_counter() - start
+    except requests.exceptions.RequestException as e:
+        return type(e).__name__, None, time.perf_counter() - start
+
+
+def run_closed_loop(url, images, concurrency, num_requests, duration, timeout):
+    """固定并发：每个并发连接收到响应后立即发送下一个请求"""
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+    sent = iter(range(num_requests)) if num_requests else None
+
+    def worker():
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if sent is not None:
+                with lock:
+                    if next(sent, None) is None:
+                        return
+            result = send_request(url, random.choice(images), timeout)
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run_open_loop(url, images, rate, num_requests, duration, timeout, max_inflight):
+    """固定到达率：按泊松过程发送请求，不等待之前的请求完成"""
+    futures = []
+    start = time.perf_counter()
+    next_send = start
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        while True:
+            if num_requests and len(futures) >= num_requests:
+                break
+            if duration and next_send - start >= duration:
+                break
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(
+                executor.submit(
+                    send_request, url, random.choice(images), timeout, next_send
+                )
+            )
+            next_send += random.expovariate(rate)
+    return [f.result() for f in futures]
+
+
+def percentile(values, p):
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = min(max(1, math.ceil(p / 100 * len(values))), len(values))
+    return values[rank - 1]
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.3f}s"
+
+
+def report(results, elapsed):
+    statuses = Counter(status for status, _, _ in results)
+    ok = [r for r in results if r[0] == 200]
+    latencies = [total for _, _, total in ok]
+    ttfbs = [ttfb for _, ttfb, _ in ok]
+    errors = len(results) - len(ok)
+
+    print("=" * 50)
+    print(f"请求总数: {len(results)}，耗时: {elapsed:.2f} 秒")
+    print(f"吞吐量: {len(ok) / elapsed:.2f} 成功请求/秒")
+    if results:
+        print(f"错误率: {errors / len(results):.2%}")
+    print(f"状态分布: {dict(statuses)}")
+    for label, values in (("延迟", latencies), ("首字节时间", ttfbs)):
+        print(
+            f"{label}: "
+            + ", ".join(
+                f"p{p}={format_seconds(percentile(values, p))}" for p in (50, 95, 99)
+            )
+            + f", max={format_seconds(max(values) if values else None)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/analyze 接口并发压测")
+    parser.add_argument("--images", default="foods", help="食物图片目录")
+    parser.add_argument("--url", default="http://localhost:8000/analyze")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=1, help="固定并发数")
+    mode.add_argument("--rate", type=float, help="固定到达率（请求/秒）")
+    parser.add_argument("--requests", type=int, default=0, help="请求总数")
+    parser.add_argument("--duration", type=float, default=0, help="压测时长（秒）")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument(
+        "--max-inflight", type=int, default=256, help="固定到达率模式下的最大在途请求数"
+    )
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        args.requests = 20
+
+    images = load_images(args.images)
+    print(f"已加载 {len(images)} 张图片，目标: {args.url}")
+
+    start = time.perf_counter()
+    if args.rate:
+        results = run_open_loop(
+            args.url,
+            images,
+            args.rate,
+            args.requests,
+            args.duration,
+            args.timeout,
+            args.max_inflight,
+        )
+    else:
+        results = run_closed_loop(
+            args.url,
+            images,
+            args.concurrency,
+            args.requests,
+            args.duration,
+            args.timeout,
+        )
+    report(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
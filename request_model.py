@@ -6,7 +6,7 @@ start_time = time.time()
 with open(image_path, "rb") as f:
     files = {"file": f}
     try:
-        response = requests.post("http://localhost:8000/analyze/", files=files)
+        response = requests.post("http://localhost:8000/analyze", files=files)
     except requests.exceptions.RequestException as e:
         print(f"请求失败: {e}")
         exit(1)